@@ -2,6 +2,9 @@
 Business Intelligence Assistant - Streamlit UI
 Interactive web interface for the assistant
 """
+import asyncio
+import threading
+from typing import AsyncGenerator, AsyncIterator, Optional
 import streamlit as st
 from datetime import datetime
 from business_assistant import BusinessAssistant
@@ -36,20 +39,72 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
+
+@st.cache_resource
+def get_assistant() -> BusinessAssistant:
+    """
+    Create a single assistant shared across sessions and reruns, so the
+    LLM, embeddings and vectorstore handles are built once. Conversation
+    history stays per session in st.session_state.
+    """
+    return BusinessAssistant()
+
+
+@st.cache_resource
+def get_event_loop() -> asyncio.AbstractEventLoop:
+    """Start one long-lived event loop so HTTP connection pools stay warm."""
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    return loop
+
+
+async def next_token(stream: AsyncIterator[str]) -> Optional[str]:
+    """Await the next streamed token, or None once the stream is done."""
+    try:
+        return await stream.__anext__()
+    except StopAsyncIteration:
+        return None
+
+
+async def close_stream(stream: AsyncGenerator[str, None]) -> None:
+    """Close a token stream so its LLM request does not outlive the script."""
+    await stream.aclose()
+
+
+@st.cache_resource(show_spinner="Loading knowledge base...")
+def load_knowledge_base(document_directory: str) -> None:
+    """Ingest a document directory once into the shared assistant."""
+    asyncio.run_coroutine_threadsafe(
+        get_assistant().load_knowledge_base(document_directory),
+        get_event_loop()
+    ).result()
+
+
 # Initialize session state
 if 'assistant' not in st.session_state:
-    st.session_state.assistant = BusinessAssistant()
-    st.session_state.initialized = False
+    st.session_state.assistant = get_assistant()
+    st.session_state.initialized = st.session_state.assistant.vectorstore is not None
     st.session_state.messages = []
+    st.session_state.history = st.session_state.assistant.new_history()
 
 # Sidebar
 with st.sidebar:
     st.header("Knowledge Base")
     if not st.session_state.initialized:
         if st.button("Load Knowledge Base"):
-            st.session_state.assistant.load_knowledge_base("data")
-            st.session_state.initialized = True
-            st.success("Knowledge base loaded!")
+            try:
+                load_knowledge_base("data")
+            except ValueError as e:
+                st.error(str(e))
+            else:
+                if st.session_state.assistant.vectorstore is None:
+                    # Nothing was ingested; drop the cached result so the
+                    # next click retries instead of being a no-op
+                    load_knowledge_base.clear()
+                    st.warning("No documents found in the knowledge base directory.")
+                else:
+                    st.session_state.initialized = True
+                    st.success("Knowledge base loaded!")
     else:
         st.success("Knowledge base loaded!")
     st.markdown("---")
@@ -76,10 +131,29 @@ for message in st.session_state.messages:
 user_input = st.text_input("Ask a question:", "")
 if user_input:
     st.session_state.messages.append({"role": "user", "content": user_input})
-    with st.spinner("Thinking..."):
-        import asyncio
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        result = loop.run_until_complete(st.session_state.assistant.process_query(user_input))
-        st.session_state.messages.append({"role": "assistant", "content": result.get("response", "(No answer)")})
+    st.markdown(f"**You:** {user_input}")
+    placeholder = st.empty()
+    response = ""
+    loop = get_event_loop()
+    stream = st.session_state.assistant.stream_query(
+        user_input,
+        history=st.session_state.history,
+        # Follow-up turns also search with the previous question
+        follow_up=bool(st.session_state.history)
+    )
+    try:
+        with st.spinner("Thinking..."):
+            # Pull tokens from the background loop and render as they arrive
+            while True:
+                token = asyncio.run_coroutine_threadsafe(
+                    next_token(stream), loop
+                ).result()
+                if token is None:
+                    break
+                response += token
+                placeholder.markdown(f"**Assistant:** {response}")
+    finally:
+        # Runs on completion and when Streamlit interrupts a rerun/stop
+        asyncio.run_coroutine_threadsafe(close_stream(stream), loop)
+    st.session_state.messages.append({"role": "assistant", "content": response or "(No answer)"})
     st.rerun()
@@ -4,14 +4,26 @@ Coordinates RAG retrieval with MCP tool execution
 """
 
 import os
-import json
+import re
+import asyncio
+import hashlib
 import logging
-from typing import Dict, List, Any, Optional
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, partial
+from itertools import islice
+from typing import AsyncIterator, Dict, List, Any, Optional
 from datetime import datetime
 
+import chromadb
+import numpy as np
+import orjson
 from langchain_openai import OpenAIEmbeddings, ChatOpenAI
 from langchain_community.vectorstores import Chroma
-from langchain_core.messages import HumanMessage, SystemMessage
+from langchain_community.vectorstores.utils import maximal_marginal_relevance
+from langchain_core.documents import Document
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
+from diskcache import Cache
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -24,6 +36,43 @@ logging.basicConfig(
 )
 logger = logging.getLogger("business-assistant")
 
+# Keywords that route a query to each MCP tool category. Queries are
+# matched word by word, so common inflections are listed explicitly.
+TOOL_KEYWORDS = {
+    "hubspot": frozenset({
+        "contact", "contacts", "contacted", "contacting",
+        "customer", "customers", "deal", "deals", "crm",
+        "company", "companies", "lead", "leads",
+        "prospect", "prospects", "prospecting",
+        "account", "accounts", "sale", "sales"
+    }),
+    "weather": frozenset({
+        "weather", "temperature", "temperatures",
+        "forecast", "forecasts", "forecasted", "forecasting",
+        "climate", "location", "locations", "city", "cities",
+        "region", "regions", "regional"
+    }),
+    "database": frozenset({
+        "note", "notes", "noted", "save", "saves", "saved", "saving",
+        "log", "logs", "logged", "logging",
+        "record", "records", "recorded", "recording",
+        "history", "previous", "previously", "past", "stored"
+    })
+}
+
+_WORD_PATTERN = re.compile(r"[a-z]+")
+
+SYSTEM_PROMPT = """You are a Business Intelligence Assistant. 
+You have access to multiple data sources including:
+- Internal knowledge base (documents, case studies, procedures)
+- CRM system (customer and deal information)
+- Weather data (for context-aware insights)
+- Historical notes database
+
+Your task is to synthesize information from these sources to provide 
+intelligent, actionable business insights. Be specific, cite sources, 
+and provide clear recommendations."""
+
 
 class BusinessAssistant:
     """
@@ -35,23 +84,42 @@ class BusinessAssistant:
         """Initialize the Business Intelligence Assistant."""
         self.openai_key = os.getenv("OPENAI_API_KEY")
         self.chroma_path = os.getenv("CHROMA_DB_PATH", "./data/chroma_db")
+        self.batch_size = int(os.getenv("CHROMA_BATCH_SIZE", "128"))
+        self.embedding_concurrency = int(os.getenv("EMBEDDING_CONCURRENCY", "8"))
+        self.hnsw_search_ef = int(os.getenv("CHROMA_HNSW_EF", "64"))
         
         # Initialize components
-        self.embeddings = OpenAIEmbeddings(api_key=self.openai_key)
+        self.embeddings = OpenAIEmbeddings(
+            model="text-embedding-3-small",
+            dimensions=int(os.getenv("EMBEDDING_DIMENSIONS", "512")),
+            api_key=self.openai_key
+        )
         self.llm = ChatOpenAI(
             model="gpt-4-turbo-preview",
             temperature=float(os.getenv("TEMPERATURE", "0.7")),
-            api_key=self.openai_key
+            api_key=self.openai_key,
+            streaming=True
         )
         
+        # Query embedding cache: in-memory LRU backed by an on-disk store
+        # so repeated questions skip the embedding API call across reruns
+        self._embed_disk_cache = Cache(os.getenv("EMBED_CACHE_DIR", ".embed_cache"))
+        self._embed_query_cached = lru_cache(maxsize=1024)(self._embed_query)
+        
         # Vector store (will be loaded when documents are ingested)
         self.vectorstore = None
         
         # MCP tool handlers (imported from existing servers)
         self.mcp_tools = self._initialize_mcp_tools()
         
-        # Conversation context
-        self.context_history = []
+        # The system prompt is constant, so build its message once
+        self._system_msg = SystemMessage(content=SYSTEM_PROMPT)
+        
+        # Conversation context (bounded so long-running servers stay flat).
+        # Callers sharing one assistant across sessions pass their own
+        # history from new_history() instead of using this one.
+        self.history_max = int(os.getenv("HISTORY_MAX", "50"))
+        self.context_history = self.new_history()
         
         logger.info("Business Intelligence Assistant initialized")
     
@@ -102,26 +170,23 @@ class BusinessAssistant:
         
         return tools
     
-    def load_knowledge_base(self, document_directory: str) -> None:
+    async def load_knowledge_base(self, document_directory: str) -> None:
         """
         Load documents into the vector database for RAG.
         
+        Blocking file, chunking and Chroma work runs in worker threads so
+        the event loop stays free while embedding requests are in flight.
+        
         Args:
             document_directory: Path to directory containing documents
         """
-        from langchain_community.document_loaders import DirectoryLoader, TextLoader
-        from langchain_text_splitters import RecursiveCharacterTextSplitter
-        
         logger.info(f"Loading documents from {document_directory}")
         
         # Load text documents
         try:
-            loader = DirectoryLoader(
-                document_directory,
-                glob="**/*.txt",
-                loader_cls=TextLoader
+            documents = await asyncio.to_thread(
+                self._load_text_documents, document_directory
             )
-            documents = loader.load()
         except Exception as e:
             logger.error(f"Error loading documents: {e}")
             documents = []
@@ -131,23 +196,218 @@ class BusinessAssistant:
             return
         
         # Chunk documents
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1000,
-            chunk_overlap=200
-        )
-        chunks = text_splitter.split_documents(documents)
+        chunks = await asyncio.to_thread(self._chunk_documents, documents)
         
         logger.info(f"Created {len(chunks)} chunks from {len(documents)} documents")
         
-        # Create vector store
-        self.vectorstore = Chroma.from_documents(
-            documents=chunks,
-            embedding=self.embeddings,
-            persist_directory=self.chroma_path
+        vectorstore = await asyncio.to_thread(self._open_vectorstore)
+        collection = vectorstore._collection
+        
+        # Chunk ids are derived from content, so comparing them with what
+        # is stored for this directory tells us which chunks are new and
+        # which belong to edited or deleted files
+        ids = self._chunk_ids(chunks)
+        stored_ids = await asyncio.to_thread(
+            self._stored_chunk_ids, collection, document_directory
         )
         
+        stale_ids = list(stored_ids.difference(ids))
+        if stale_ids:
+            await asyncio.to_thread(collection.delete, ids=stale_ids)
+        
+        new_chunks = [
+            (chunk_id, chunk)
+            for chunk_id, chunk in zip(ids, chunks)
+            if chunk_id not in stored_ids
+        ]
+        logger.info(
+            f"Removed {len(stale_ids)} stale chunks, "
+            f"embedding {len(new_chunks)} new chunks"
+        )
+        
+        # Ingest new chunks in batches: one embedding request and one
+        # collection upsert per batch instead of per chunk
+        batches = list(self._batched(new_chunks, self.batch_size))
+        vectors_per_batch = await self._aembed_batches(
+            [[chunk for _, chunk in batch] for batch in batches]
+        )
+        
+        for batch, vectors in zip(batches, vectors_per_batch):
+            await asyncio.to_thread(
+                collection.upsert,
+                ids=[chunk_id for chunk_id, _ in batch],
+                documents=[chunk.page_content for _, chunk in batch],
+                metadatas=[chunk.metadata for _, chunk in batch],
+                embeddings=vectors
+            )
+        
+        # Publish the store only once it is fully populated
+        self.vectorstore = vectorstore
         logger.info("Knowledge base loaded successfully")
     
+    def _chunk_documents(self, documents: list[Document]) -> list[Document]:
+        """Split documents into overlapping chunks that keep their metadata."""
+        from semantic_text_splitter import TextSplitter
+        
+        text_splitter = TextSplitter(1000, overlap=200)
+        return [
+            Document(page_content=text, metadata=dict(doc.metadata))
+            for doc in documents
+            for text in text_splitter.chunks(doc.page_content)
+        ]
+    
+    def _collection_name(self) -> str:
+        """
+        Name the collection after the embedding model and dimension, so
+        vectors of different shapes never share an index.
+        """
+        name = f"kb-{self.embeddings.model}-{self.embeddings.dimensions}"
+        return re.sub(r"[^A-Za-z0-9_-]", "-", name)
+    
+    def _open_vectorstore(self) -> Chroma:
+        """
+        Open the persistent knowledge base collection, creating it as a
+        cosine-space HNSW index (OpenAI embeddings are unit-norm).
+        
+        Raises:
+            ValueError: If the existing collection was built with different
+                index settings, which Chroma cannot change after creation
+        """
+        client = chromadb.PersistentClient(path=self.chroma_path)
+        name = self._collection_name()
+        metadata = {
+            "hnsw:space": "cosine",
+            "hnsw:M": 16,
+            "hnsw:construction_ef": 200,
+            "hnsw:search_ef": self.hnsw_search_ef
+        }
+        
+        try:
+            collection = client.get_collection(name)
+        except ValueError:
+            collection = client.create_collection(name, metadata=metadata)
+        
+        if collection.metadata != metadata:
+            raise ValueError(
+                f"Collection '{name}' in {self.chroma_path} was built with "
+                f"index settings {collection.metadata}, but the current "
+                f"configuration requires {metadata}. Restore the previous "
+                f"CHROMA_HNSW_EF or delete the collection and reload the "
+                f"knowledge base."
+            )
+        
+        return Chroma(
+            client=client,
+            collection_name=name,
+            embedding_function=self.embeddings
+        )
+    
+    def _load_text_documents(self, directory: str) -> list[Document]:
+        """
+        Read every .txt file under a directory in parallel.
+        
+        Args:
+            directory: Root directory to search recursively
+            
+        Returns:
+            One Document per file, with its path as the source
+        """
+        paths = list(self._find_text_files(directory))
+        
+        def read(path: str) -> Document:
+            with open(path, encoding="utf-8") as f:
+                return Document(page_content=f.read(), metadata={"source": path})
+        
+        with ThreadPoolExecutor(max_workers=16) as executor:
+            return list(executor.map(read, paths))
+    
+    def _find_text_files(self, directory: str):
+        """
+        Yield paths of non-hidden .txt files under a directory. Symlinked
+        directories are not followed, so link cycles cannot recurse forever.
+        """
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.name.startswith("."):
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    yield from self._find_text_files(entry.path)
+                elif entry.is_file() and entry.name.endswith(".txt"):
+                    yield entry.path
+    
+    async def _aembed_batches(self, batches: list[list[Any]]) -> list[list[list[float]]]:
+        """
+        Embed chunk batches concurrently, bounded by a semaphore.
+        
+        Args:
+            batches: Lists of document chunks
+            
+        Returns:
+            Embedding vectors for each batch, in input order
+        """
+        semaphore = asyncio.Semaphore(self.embedding_concurrency)
+        
+        async def bounded(batch: list[Any]) -> list[list[float]]:
+            async with semaphore:
+                return await self.embeddings.aembed_documents(
+                    [chunk.page_content for chunk in batch]
+                )
+        
+        tasks = [bounded(batch) for batch in batches]
+        return await asyncio.gather(*tasks)
+    
+    @staticmethod
+    def _stored_chunk_ids(collection: Any, directory: str) -> set[str]:
+        """
+        Return the ids of stored chunks whose source lies under a directory.
+        
+        Chroma's where clause has no prefix match, so this reads the
+        metadata of every stored chunk; only ids and metadata are fetched,
+        never documents or embeddings.
+        
+        Args:
+            collection: Chroma collection backing the knowledge base
+            directory: Directory the sources were loaded from
+            
+        Returns:
+            Ids of chunks previously loaded from that directory
+        """
+        prefix = os.path.join(directory, "")
+        stored = collection.get(include=["metadatas"])
+        return {
+            chunk_id
+            for chunk_id, metadata in zip(stored["ids"], stored["metadatas"])
+            if (metadata or {}).get("source", "").startswith(prefix)
+        }
+    
+    @staticmethod
+    def _chunk_ids(chunks: list[Document]) -> list[str]:
+        """
+        Derive a stable id for each chunk from its source, its position
+        within that source, and its content.
+        
+        Args:
+            chunks: Document chunks, grouped by source in reading order
+            
+        Returns:
+            One id per chunk, in input order
+        """
+        positions = Counter()
+        ids = []
+        for chunk in chunks:
+            source = chunk.metadata.get("source", "unknown")
+            key = f"{source}\0{positions[source]}\0{chunk.page_content}"
+            positions[source] += 1
+            ids.append(hashlib.blake2b(key.encode("utf-8"), digest_size=16).hexdigest())
+        return ids
+    
+    @staticmethod
+    def _batched(items: list[Any], size: int):
+        """Yield successive lists of at most `size` items."""
+        iterator = iter(items)
+        while batch := list(islice(iterator, size)):
+            yield batch
+    
     def _select_tools(self, query: str) -> list[str]:
         """
         Intelligently select which tools to use based on the query.
@@ -158,7 +418,7 @@ class BusinessAssistant:
         Returns:
             List of tool categories to use
         """
-        query_lower = query.lower()
+        tokens = set(_WORD_PATTERN.findall(query.lower()))
         selected_tools = []
         
         # Always use RAG for knowledge retrieval
@@ -166,41 +426,101 @@ class BusinessAssistant:
             selected_tools.append("rag")
         
         # HubSpot CRM keywords
-        crm_keywords = [
-            "contact", "customer", "deal", "crm", "company",
-            "lead", "prospect", "account", "sales"
-        ]
-        if any(keyword in query_lower for keyword in crm_keywords):
+        if tokens & TOOL_KEYWORDS["hubspot"]:
             if self.mcp_tools["hubspot"]["available"]:
                 selected_tools.append("hubspot")
         
         # Weather keywords
-        weather_keywords = [
-            "weather", "temperature", "forecast", "climate",
-            "location", "city", "region"
-        ]
-        if any(keyword in query_lower for keyword in weather_keywords):
+        if tokens & TOOL_KEYWORDS["weather"]:
             if self.mcp_tools["weather"]["available"]:
                 selected_tools.append("weather")
         
         # Database keywords (for logging/retrieval)
-        db_keywords = [
-            "note", "save", "log", "record", "history",
-            "previous", "past", "stored"
-        ]
-        if any(keyword in query_lower for keyword in db_keywords):
+        if tokens & TOOL_KEYWORDS["database"]:
             selected_tools.append("database")
         
         logger.info(f"Selected tools for query: {selected_tools}")
         return selected_tools
     
-    def _retrieve_from_rag(self, query: str, k: int = 3) -> list[Dict[str, Any]]:
+    def _embedding_cache_key(self, query: str) -> str:
+        """Content hash identifying a query embedding in the disk cache."""
+        return hashlib.blake2b(
+            f"{self.embeddings.model}:{self.embeddings.dimensions}:{query}".encode("utf-8"),
+            digest_size=16
+        ).hexdigest()
+    
+    def _embed_query(self, query: str) -> list[float]:
+        """
+        Embed a query, reusing a previously persisted vector when available.
+        
+        Args:
+            query: Search query
+            
+        Returns:
+            Query embedding vector
+        """
+        key = self._embedding_cache_key(query)
+        
+        vector = self._embed_disk_cache.get(key)
+        if vector is None:
+            vector = self.embeddings.embed_query(query)
+            self._embed_disk_cache.set(key, vector)
+        return vector
+    
+    def _embed_queries(self, queries: list[str]) -> list[list[float]]:
+        """
+        Embed several queries, batching all cache misses into one API call.
+        
+        Args:
+            queries: Search queries
+            
+        Returns:
+            One embedding vector per query, in input order
+        """
+        keys = [self._embedding_cache_key(query) for query in queries]
+        vectors = [self._embed_disk_cache.get(key) for key in keys]
+        
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            embedded = self.embeddings.embed_documents(
+                [queries[i] for i in missing]
+            )
+            for i, vector in zip(missing, embedded):
+                vectors[i] = vector
+                self._embed_disk_cache.set(keys[i], vector)
+        return vectors
+    
+    def _build_where(
+        self,
+        filters: Optional[Dict[str, Any]]
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Translate retrieval filters into a Chroma metadata `where` clause,
+        so non-matching documents are skipped inside Chroma.
+        
+        Args:
+            filters: Optional filters, e.g. {"sources": [...]}
+            
+        Returns:
+            Chroma where clause, or None when nothing is filtered
+        """
+        if not filters or not filters.get("sources"):
+            return None
+        return {"source": {"$in": list(filters["sources"])}}
+    
+    def _retrieve_from_rag(
+        self,
+        query: str,
+        k: int = 3,
+        filters: Optional[Dict[str, Any]] = None
+    ) -> list[Dict[str, Any]]:
         """
         Retrieve relevant documents from the knowledge base.
         
         Args:
             query: Search query
             k: Number of results to retrieve
+            filters: Optional metadata filters, e.g. {"sources": [...]}
             
         Returns:
             List of relevant documents
@@ -210,7 +530,15 @@ class BusinessAssistant:
             return []
         
         try:
-            docs = self.vectorstore.similarity_search(query, k=k)
+            vector = self._embed_query_cached(query)
+            # MMR over a wider candidate pool avoids near-duplicate chunks
+            docs = self.vectorstore.max_marginal_relevance_search_by_vector(
+                vector,
+                k=k,
+                fetch_k=20,
+                lambda_mult=0.5,
+                filter=self._build_where(filters)
+            )
             results = [
                 {
                     "content": doc.page_content,
@@ -225,7 +553,263 @@ class BusinessAssistant:
             logger.error(f"RAG retrieval error: {e}")
             return []
     
-    async def process_query(self, query: str) -> Dict[str, Any]:
+    def _retrieve_many(
+        self,
+        queries: list[str],
+        k: int = 3,
+        filters: Optional[Dict[str, Any]] = None
+    ) -> list[Dict[str, Any]]:
+        """
+        Retrieve documents for several related queries in one Chroma call.
+        
+        Args:
+            queries: Search queries, the current turn first, then its probes
+            k: Number of results to retrieve
+            filters: Optional metadata filters, e.g. {"sources": [...]}
+            
+        Returns:
+            The k documents picked by MMR from the merged candidate pool
+        """
+        if not self.vectorstore:
+            logger.warning("Vector store not initialized")
+            return []
+        
+        try:
+            query_vector = self._embed_query_cached(queries[0])
+            vectors = [query_vector, *self._embed_queries(queries[1:])]
+            # Same candidate pool per probe as the single-query MMR search
+            response = self.vectorstore._collection.query(
+                query_embeddings=vectors,
+                n_results=20,
+                where=self._build_where(filters),
+                include=["documents", "metadatas", "embeddings"]
+            )
+            results = self._merge_query_hits(response, query_vector, k)
+            logger.info(f"Retrieved {len(results)} documents from RAG for {len(queries)} queries")
+            return results
+        except Exception as e:
+            logger.error(f"RAG retrieval error: {e}")
+            return []
+    
+    @staticmethod
+    def _merge_query_hits(
+        response: Dict[str, Any],
+        query_vector: list[float],
+        k: int
+    ) -> list[Dict[str, Any]]:
+        """
+        Merge a multi-query Chroma response into one candidate pool and
+        rerank it with MMR against the current query.
+        
+        Args:
+            response: collection.query output with documents, metadatas
+                and embeddings, one inner list per query
+            query_vector: Embedding of the current query
+            k: Maximum number of results to keep
+            
+        Returns:
+            The k documents MMR selects from the distinct candidates
+        """
+        pool = {}
+        for contents, metadatas, embeddings in zip(
+            response["documents"],
+            response["metadatas"],
+            response["embeddings"]
+        ):
+            for content, metadata, embedding in zip(
+                contents, metadatas, embeddings
+            ):
+                pool.setdefault(content, (metadata, embedding))
+        if not pool:
+            return []
+        
+        candidates = list(pool.items())
+        selected = maximal_marginal_relevance(
+            np.array(query_vector, dtype=np.float32),
+            [embedding for _, (_, embedding) in candidates],
+            lambda_mult=0.5,
+            k=k
+        )
+        return [
+            {
+                "content": candidates[i][0],
+                "metadata": candidates[i][1][0],
+                "source": candidates[i][1][0].get("source", "unknown")
+            }
+            for i in selected
+        ]
+    
+    async def _aretrieve_from_rag(
+        self,
+        query: str,
+        k: int = 3,
+        filters: Optional[Dict[str, Any]] = None,
+        probes: Optional[list[str]] = None
+    ) -> list[Dict[str, Any]]:
+        """
+        Run RAG retrieval in a worker thread, since Chroma is synchronous.
+        
+        By default this is the cached-embedding MMR search. Extra probe
+        queries switch to one batched multi-query Chroma call instead.
+        """
+        if not probes:
+            return await asyncio.to_thread(
+                self._retrieve_from_rag, query, k, filters
+            )
+        
+        queries = [query, *probes]
+        return await asyncio.to_thread(self._retrieve_many, queries, k, filters)
+    
+    # MCP tool execution (placeholders - will implement specific handlers)
+    
+    async def _acall_hubspot(self, query: str) -> Dict[str, Any]:
+        """Query the HubSpot MCP server."""
+        return {
+            "status": "available",
+            "message": "HubSpot integration ready"
+        }
+    
+    async def _acall_weather(self, query: str) -> Dict[str, Any]:
+        """Query the Weather MCP server."""
+        return {
+            "status": "available",
+            "message": "Weather integration ready"
+        }
+    
+    async def _acall_database(self, query: str) -> Dict[str, Any]:
+        """Query the Database MCP server."""
+        return {
+            "status": "available",
+            "message": "Database integration ready"
+        }
+    
+    async def _gather_information(
+        self,
+        query: str,
+        selected_tools: list[str],
+        filters: Optional[Dict[str, Any]] = None,
+        probes: Optional[list[str]] = None
+    ) -> Dict[str, Any]:
+        """
+        Gather information for a query from the selected tools.
+        
+        Args:
+            query: User's question or request
+            selected_tools: Tool categories chosen by _select_tools
+            filters: Optional knowledge base filters, e.g. {"sources": [...]}
+            probes: Optional extra retrieval queries
+            
+        Returns:
+            Dict containing the selected tools and their results
+        """
+        gathered_info = {
+            "query": query,
+            "timestamp": datetime.now().isoformat(),
+            "tools_used": selected_tools,
+            "results": {}
+        }
+        
+        # RAG retrieval and MCP tool calls are independent, so run them
+        # concurrently
+        tool_calls = {
+            "rag": partial(
+                self._aretrieve_from_rag, filters=filters, probes=probes
+            ),
+            "hubspot": self._acall_hubspot,
+            "weather": self._acall_weather,
+            "database": self._acall_database
+        }
+        coros = {
+            tool: tool_calls[tool](query)
+            for tool in selected_tools
+        }
+        results = await asyncio.gather(*coros.values())
+        gathered_info["results"].update(zip(coros.keys(), results))
+        
+        # Serialize tool results once, compactly, for the LLM context
+        gathered_info["rendered"] = {
+            tool: orjson.dumps(result).decode("utf-8")
+            for tool, result in gathered_info["results"].items()
+            if tool != "rag"
+        }
+        
+        return gathered_info
+    
+    async def _prepare_messages(
+        self,
+        query: str,
+        selected_tools: list[str],
+        filters: Optional[Dict[str, Any]] = None,
+        probes: Optional[list[str]] = None
+    ) -> tuple[list[Dict[str, Any]], list[BaseMessage]]:
+        """
+        Gather information from the selected tools and build the LLM prompt.
+        
+        Args:
+            query: User's question or request
+            selected_tools: Tool categories chosen by _select_tools
+            filters: Optional knowledge base filters, e.g. {"sources": [...]}
+            probes: Optional extra retrieval queries
+            
+        Returns:
+            The RAG results used and the messages for the LLM
+        """
+        # Fast path: knowledge base only, so skip the tool fan-out and
+        # per-tool rendering
+        if selected_tools == ["rag"]:
+            rag_results = await self._aretrieve_from_rag(
+                query, filters=filters, probes=probes
+            )
+            context = self._format_rag_context(rag_results)
+            return rag_results, [
+                self._system_msg,
+                HumanMessage(content=self._build_user_message(query, context))
+            ]
+        
+        gathered_info = await self._gather_information(
+            query, selected_tools, filters, probes
+        )
+        return (
+            gathered_info["results"].get("rag", []),
+            self._build_messages(query, gathered_info)
+        )
+    
+    def _follow_up_probes(
+        self,
+        query: str,
+        history: deque,
+        follow_up: bool
+    ) -> Optional[list[str]]:
+        """
+        Build the extra retrieval probe for a follow-up question: the
+        previous turn of the same session combined with the new query.
+        """
+        if not follow_up or not history:
+            return None
+        return [f"{history[-1]['query']}\n{query}"]
+    
+    def _record_history(
+        self,
+        history: deque,
+        query: str,
+        response: str,
+        tools_used: list[str]
+    ) -> None:
+        """Store a completed exchange in a conversation history."""
+        history.append({
+            "query": query,
+            "response": response,
+            "tools_used": tools_used,
+            "timestamp": datetime.now().isoformat()
+        })
+    
+    async def process_query(
+        self,
+        query: str,
+        filters: Optional[Dict[str, Any]] = None,
+        history: Optional[deque] = None,
+        follow_up: bool = False
+    ) -> Dict[str, Any]:
         """
         Main orchestration method. Processes a user query by:
         1. Selecting appropriate tools
@@ -235,58 +819,36 @@ class BusinessAssistant:
         
         Args:
             query: User's question or request
+            filters: Optional knowledge base filters, e.g. {"sources": [...]}
+            history: Per-session history from new_history(); defaults to
+                this assistant's own history
+            follow_up: Also retrieve for the previous turn in `history`
+                combined with this query
             
         Returns:
             Dict containing the response and metadata
         """
         logger.info(f"Processing query: {query}")
         start_time = datetime.now()
+        if history is None:
+            history = self.context_history
         
         # Step 1: Select tools
         selected_tools = self._select_tools(query)
         
         # Step 2: Gather information from selected sources
-        gathered_info = {
-            "query": query,
-            "timestamp": start_time.isoformat(),
-            "tools_used": selected_tools,
-            "results": {}
-        }
-        
-        # RAG retrieval
-        if "rag" in selected_tools:
-            rag_results = self._retrieve_from_rag(query)
-            gathered_info["results"]["rag"] = rag_results
-        
-        # MCP tool execution (placeholder - will implement specific handlers)
-        if "hubspot" in selected_tools:
-            gathered_info["results"]["hubspot"] = {
-                "status": "available",
-                "message": "HubSpot integration ready"
-            }
-        
-        if "weather" in selected_tools:
-            gathered_info["results"]["weather"] = {
-                "status": "available",
-                "message": "Weather integration ready"
-            }
-        
-        if "database" in selected_tools:
-            gathered_info["results"]["database"] = {
-                "status": "available",
-                "message": "Database integration ready"
-            }
+        rag_results, messages = await self._prepare_messages(
+            query,
+            selected_tools,
+            filters,
+            self._follow_up_probes(query, history, follow_up)
+        )
         
         # Step 3: Synthesize with LLM
-        response = await self._synthesize_response(query, gathered_info)
+        response = await self._synthesize_response(messages)
         
         # Step 4: Store in context history
-        self.context_history.append({
-            "query": query,
-            "response": response,
-            "tools_used": selected_tools,
-            "timestamp": datetime.now().isoformat()
-        })
+        self._record_history(history, query, response, selected_tools)
         
         elapsed = (datetime.now() - start_time).total_seconds()
         logger.info(f"Query processed in {elapsed:.2f} seconds")
@@ -297,61 +859,79 @@ class BusinessAssistant:
             "metadata": {
                 "tools_used": selected_tools,
                 "processing_time": elapsed,
-                "sources": self._extract_sources(gathered_info)
+                "sources": self._extract_sources(rag_results)
             }
         }
     
-    async def _synthesize_response(
-        self, 
-        query: str, 
-        gathered_info: Dict[str, Any]
-    ) -> str:
+    async def stream_query(
+        self,
+        query: str,
+        filters: Optional[Dict[str, Any]] = None,
+        history: Optional[deque] = None,
+        follow_up: bool = False
+    ) -> AsyncIterator[str]:
         """
-        Use LLM to synthesize information from multiple sources.
+        Streaming variant of process_query that yields response tokens
+        as the LLM generates them.
         
         Args:
-            query: Original user query
-            gathered_info: Information gathered from tools
+            query: User's question or request
+            filters: Optional knowledge base filters, e.g. {"sources": [...]}
+            history: Per-session history from new_history(); defaults to
+                this assistant's own history
+            follow_up: Also retrieve for the previous turn in `history`
+                combined with this query
             
-        Returns:
-            Synthesized response
+        Yields:
+            Response text chunks
         """
-        # Build context from gathered information
-        context_parts = []
+        logger.info(f"Streaming query: {query}")
+        start_time = datetime.now()
+        if history is None:
+            history = self.context_history
         
-        # Add RAG results
-        if "rag" in gathered_info.get("results", {}):
-            rag_results = gathered_info["results"]["rag"]
-            if rag_results:
-                context_parts.append("=== Knowledge Base Information ===")
-                for i, doc in enumerate(rag_results, 1):
-                    context_parts.append(f"\nDocument {i}:")
-                    context_parts.append(doc["content"][:500])  # Truncate for context
-                    context_parts.append(f"Source: {doc['source']}")
-        
-        # Add MCP tool results
-        for tool in ["hubspot", "weather", "database"]:
-            if tool in gathered_info.get("results", {}):
-                tool_result = gathered_info["results"][tool]
-                context_parts.append(f"\n=== {tool.title()} Data ===")
-                context_parts.append(json.dumps(tool_result, indent=2))
+        selected_tools = self._select_tools(query)
+        _, messages = await self._prepare_messages(
+            query,
+            selected_tools,
+            filters,
+            self._follow_up_probes(query, history, follow_up)
+        )
         
-        context = "\n".join(context_parts)
+        # Close the LLM stream and record whatever was generated even if
+        # the consumer stops early and closes this generator
+        response_parts = []
+        token_stream = self._stream_response(messages)
+        try:
+            async for token in token_stream:
+                response_parts.append(token)
+                yield token
+        finally:
+            await token_stream.aclose()
+            self._record_history(
+                history, query, "".join(response_parts), selected_tools
+            )
         
-        # Create system prompt
-        system_prompt = """You are a Business Intelligence Assistant. 
-You have access to multiple data sources including:
-- Internal knowledge base (documents, case studies, procedures)
-- CRM system (customer and deal information)
-- Weather data (for context-aware insights)
-- Historical notes database
-
-Your task is to synthesize information from these sources to provide 
-intelligent, actionable business insights. Be specific, cite sources, 
-and provide clear recommendations."""
+        elapsed = (datetime.now() - start_time).total_seconds()
+        logger.info(f"Query streamed in {elapsed:.2f} seconds")
+    
+    def _format_rag_context(self, rag_results: list[Dict[str, Any]]) -> str:
+        """Render retrieved documents as a knowledge base context section."""
+        if not rag_results:
+            return ""
         
-        # Create user message with context
-        user_message = f"""Query: {query}
+        return "\n".join([
+            "=== Knowledge Base Information ===",
+            *(
+                # Truncate for context
+                f"\nDocument {i}:\n{doc['content'][:500]}\nSource: {doc['source']}"
+                for i, doc in enumerate(rag_results, 1)
+            )
+        ])
+    
+    def _build_user_message(self, query: str, context: str) -> str:
+        """Wrap the query and its gathered context in the user prompt."""
+        return f"""Query: {query}
 
 Available Context:
 {context}
@@ -361,37 +941,110 @@ Please provide a comprehensive response that:
 2. References specific information from the sources
 3. Provides actionable insights or recommendations
 4. Cites sources clearly"""
+    
+    def _build_messages(
+        self,
+        query: str,
+        gathered_info: Dict[str, Any]
+    ) -> list[BaseMessage]:
+        """
+        Build the LLM prompt from information gathered across sources.
         
-        try:
-            messages = [
-                SystemMessage(content=system_prompt),
-                HumanMessage(content=user_message)
-            ]
+        Args:
+            query: Original user query
+            gathered_info: Information gathered from tools
+            
+        Returns:
+            System and user messages for the LLM
+        """
+        # Build context from gathered information
+        context_parts = []
+        
+        # Add RAG results
+        rag_context = self._format_rag_context(
+            gathered_info.get("results", {}).get("rag")
+        )
+        if rag_context:
+            context_parts.append(rag_context)
+        
+        # Add MCP tool results, serialized once at gather time
+        context_parts.extend(
+            f"\n=== {tool.title()} Data ===\n{rendered}"
+            for tool, rendered in gathered_info.get("rendered", {}).items()
+        )
+        
+        context = "\n".join(context_parts)
+        
+        return [
+            self._system_msg,
+            HumanMessage(content=self._build_user_message(query, context))
+        ]
+    
+    async def _synthesize_response(self, messages: list[BaseMessage]) -> str:
+        """
+        Use LLM to synthesize information from multiple sources.
+        
+        Args:
+            messages: System and user messages built from gathered context
             
-            response = self.llm.invoke(messages)
+        Returns:
+            Synthesized response
+        """
+        try:
+            response = await self.llm.ainvoke(messages)
             return response.content
         
         except Exception as e:
             logger.error(f"LLM synthesis error: {e}")
             return f"I encountered an error processing your request: {str(e)}"
     
-    def _extract_sources(self, gathered_info: Dict[str, Any]) -> list[str]:
-        """Extract source citations from gathered information."""
+    async def _stream_response(
+        self,
+        messages: list[BaseMessage]
+    ) -> AsyncIterator[str]:
+        """
+        Stream the LLM synthesis token by token.
+        
+        Args:
+            messages: System and user messages built from gathered context
+            
+        Yields:
+            Response text chunks
+        """
+        chunks = self.llm.astream(messages)
+        try:
+            async for chunk in chunks:
+                if chunk.content:
+                    yield chunk.content
+        
+        except Exception as e:
+            logger.error(f"LLM synthesis error: {e}")
+            yield f"I encountered an error processing your request: {str(e)}"
+        
+        finally:
+            # Release the HTTP stream if the consumer stops early
+            await chunks.aclose()
+    
+    def _extract_sources(self, rag_results: list[Dict[str, Any]]) -> list[str]:
+        """Extract source citations from retrieved documents."""
         sources = []
         
-        if "rag" in gathered_info.get("results", {}):
-            for doc in gathered_info["results"]["rag"]:
-                source = doc.get("source", "unknown")
-                if source not in sources:
-                    sources.append(source)
+        for doc in rag_results:
+            source = doc.get("source", "unknown")
+            if source not in sources:
+                sources.append(source)
         
         return sources
     
+    def new_history(self) -> deque:
+        """Create an empty, bounded conversation history for one session."""
+        return deque(maxlen=self.history_max)
+    
     def get_conversation_history(self) -> list[Dict[str, Any]]:
         """Return the conversation history."""
-        return self.context_history
+        return list(self.context_history)
     
     def clear_history(self) -> None:
         """Clear conversation history."""
-        self.context_history = []
+        self.context_history.clear()
         logger.info("Conversation history cleared")
\ No newline at end of file
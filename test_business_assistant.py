@@ -0,0 +1,246 @@
+"""
+Business Intelligence Assistant - Tests
+Unit tests for the orchestration engine helpers
+"""
+import os
+
+import pytest
+from langchain_core.documents import Document
+
+from business_assistant import BusinessAssistant
+
+
+@pytest.fixture
+def assistant(monkeypatch, tmp_path):
+    monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+    monkeypatch.setenv("EMBED_CACHE_DIR", str(tmp_path / "embed_cache"))
+    monkeypatch.setenv("CHROMA_DB_PATH", str(tmp_path / "chroma_db"))
+    return BusinessAssistant()
+
+
+def test_batched_splits_items_into_fixed_size_groups():
+    batches = list(BusinessAssistant._batched(list(range(7)), 3))
+    assert batches == [[0, 1, 2], [3, 4, 5], [6]]
+
+
+def test_batched_handles_empty_input():
+    assert list(BusinessAssistant._batched([], 3)) == []
+
+
+def test_chunk_ids_are_stable_across_loads():
+    chunks = [
+        Document(page_content="alpha", metadata={"source": "a.txt"}),
+        Document(page_content="beta", metadata={"source": "a.txt"}),
+        Document(page_content="alpha", metadata={"source": "b.txt"}),
+    ]
+    reloaded = [
+        Document(page_content=chunk.page_content, metadata=dict(chunk.metadata))
+        for chunk in chunks
+    ]
+    assert BusinessAssistant._chunk_ids(chunks) == BusinessAssistant._chunk_ids(reloaded)
+
+
+class _FakeEmbeddings:
+    model = "fake-embedding"
+    dimensions = 4
+
+    def __init__(self):
+        self.embedded = []
+
+    async def aembed_documents(self, texts):
+        self.embedded.extend(texts)
+        return [[1.0, float(len(text)), 0.0, 0.5] for text in texts]
+
+
+@pytest.mark.asyncio
+async def test_reload_replaces_chunks_of_edited_and_deleted_files(assistant, tmp_path):
+    assistant.embeddings = _FakeEmbeddings()
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    (docs / "edited.txt").write_text("original paragraph. " * 120)
+    (docs / "removed.txt").write_text("soon to be deleted")
+    (docs / "kept.txt").write_text("unchanged content")
+
+    await assistant.load_knowledge_base(str(docs))
+    assistant.embeddings.embedded.clear()
+
+    (docs / "edited.txt").write_text("short replacement")
+    (docs / "removed.txt").unlink()
+    await assistant.load_knowledge_base(str(docs))
+
+    stored = assistant.vectorstore._collection.get(include=["documents"])
+    assert sorted(stored["documents"]) == ["short replacement", "unchanged content"]
+    assert assistant.embeddings.embedded == ["short replacement"]
+
+
+def test_chunk_ids_distinguish_repeated_content():
+    chunks = [
+        Document(page_content="same", metadata={"source": "a.txt"}),
+        Document(page_content="same", metadata={"source": "a.txt"}),
+        Document(page_content="same", metadata={"source": "b.txt"}),
+    ]
+    ids = BusinessAssistant._chunk_ids(chunks)
+    assert len(set(ids)) == 3
+
+
+@pytest.mark.skipif(not hasattr(os, "symlink"), reason="symlinks unsupported")
+def test_find_text_files_does_not_follow_symlink_cycles(assistant, tmp_path):
+    docs = tmp_path / "docs"
+    (docs / "sub").mkdir(parents=True)
+    (docs / "a.txt").write_text("alpha")
+    (docs / "sub" / "b.txt").write_text("beta")
+    (docs / ".hidden.txt").write_text("hidden")
+    os.symlink(docs, docs / "sub" / "loop", target_is_directory=True)
+
+    found = sorted(os.path.relpath(path, docs) for path in assistant._find_text_files(str(docs)))
+    assert found == ["a.txt", os.path.join("sub", "b.txt")]
+
+
+def test_collection_name_includes_model_and_dimension(assistant):
+    assert assistant._collection_name() == "kb-text-embedding-3-small-512"
+
+
+def test_open_vectorstore_rejects_changed_index_settings(assistant):
+    assistant._open_vectorstore()
+    assistant.hnsw_search_ef = 128
+
+    with pytest.raises(ValueError, match="CHROMA_HNSW_EF"):
+        assistant._open_vectorstore()
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("Show me the logged deals", ["hubspot", "database"]),
+    ("What is the forecasting outlook?", ["weather"]),
+    ("Which notes were saved yesterday?", ["database"]),
+    ("Find recorded calls with our contacts", ["hubspot", "database"]),
+    ("Compare the cities we operate in", ["weather"]),
+    ("Summarize our onboarding process", []),
+])
+def test_select_tools_routes_inflected_keywords(assistant, query, expected):
+    for category in ("hubspot", "weather"):
+        assistant.mcp_tools[category]["available"] = True
+
+    assert assistant._select_tools(query) == expected
+
+
+class _FakeChunk:
+    def __init__(self, content):
+        self.content = content
+
+
+class _FakeStreamingLLM:
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.closed = False
+
+    async def astream(self, messages):
+        try:
+            for token in self.tokens:
+                yield _FakeChunk(token)
+        finally:
+            self.closed = True
+
+
+@pytest.mark.asyncio
+async def test_stream_query_closing_early_releases_llm_stream(assistant):
+    assistant.llm = _FakeStreamingLLM(["Hello", " there", "!"])
+
+    stream = assistant.stream_query("hello")
+    assert await stream.__anext__() == "Hello"
+    await stream.aclose()
+
+    assert assistant.llm.closed
+    assert assistant.get_conversation_history()[-1]["response"] == "Hello"
+
+
+@pytest.mark.asyncio
+async def test_stream_query_records_into_the_callers_history(assistant):
+    assistant.llm = _FakeStreamingLLM(["Hi"])
+    first, second = assistant.new_history(), assistant.new_history()
+
+    async for _ in assistant.stream_query("first session", history=first):
+        pass
+
+    assert [turn["query"] for turn in first] == ["first session"]
+    assert len(second) == 0
+    assert assistant.get_conversation_history() == []
+
+
+def test_merge_query_hits_reranks_pool_with_mmr():
+    a, b, c = [0.9, 0.44, 0.0], [0.88, 0.47, 0.0], [0.8, 0.0, 0.6]
+    response = {
+        "documents": [["a", "b"], ["b", "c"]],
+        "metadatas": [
+            [{"source": "1.txt"}, {"source": "2.txt"}],
+            [{"source": "2.txt"}, {"source": "3.txt"}],
+        ],
+        "embeddings": [[a, b], [b, c]],
+    }
+
+    results = BusinessAssistant._merge_query_hits(response, [1.0, 0.0, 0.0], k=2)
+
+    # b is nearly a duplicate of a, so MMR picks the more diverse c instead
+    assert [doc["content"] for doc in results] == ["a", "c"]
+    assert [doc["source"] for doc in results] == ["1.txt", "3.txt"]
+
+
+def test_merge_query_hits_handles_empty_response():
+    response = {"documents": [[]], "metadatas": [[]], "embeddings": [[]]}
+    assert BusinessAssistant._merge_query_hits(response, [1.0, 0.0], k=3) == []
+
+
+def test_build_where_translates_source_filters(assistant):
+    assert assistant._build_where(None) is None
+    assert assistant._build_where({"sources": []}) is None
+    assert assistant._build_where({"sources": ("a.txt", "b.txt")}) == {
+        "source": {"$in": ["a.txt", "b.txt"]}
+    }
+
+
+@pytest.fixture
+def retrieval_calls(assistant, monkeypatch):
+    calls = []
+    monkeypatch.setattr(
+        assistant, "_retrieve_from_rag",
+        lambda query, k, filters: calls.append(("single", [query])) or []
+    )
+    monkeypatch.setattr(
+        assistant, "_retrieve_many",
+        lambda queries, k, filters: calls.append(("many", queries)) or []
+    )
+    return calls
+
+
+@pytest.mark.asyncio
+async def test_follow_up_probe_is_opt_in(assistant, retrieval_calls):
+    assistant.vectorstore = object()
+    assistant.llm = _FakeStreamingLLM(["ok"])
+    history = assistant.new_history()
+    history.append({"query": "Who is our biggest client?"})
+
+    async for _ in assistant.stream_query("What did they buy?", history=history):
+        pass
+    async for _ in assistant.stream_query(
+        "And last year?", history=history, follow_up=True
+    ):
+        pass
+
+    assert retrieval_calls == [
+        ("single", ["What did they buy?"]),
+        ("many", ["And last year?", "What did they buy?\nAnd last year?"]),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_follow_up_probe_ignores_other_sessions(assistant, retrieval_calls):
+    assistant.vectorstore = object()
+    assistant.llm = _FakeStreamingLLM(["ok"])
+    other_session = assistant.new_history()
+    other_session.append({"query": "private question"})
+
+    async for _ in assistant.stream_query(
+        "New question", history=assistant.new_history(), follow_up=True
+    ):
+        pass
+
+    assert retrieval_calls == [("single", ["New question"])]